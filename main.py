@@ -5,12 +5,82 @@ A web interface for interacting with Salesforce Agentforce API
 """
 
 import os
-import json
-from typing import Optional, Dict, Any
+import re
+import asyncio
+import logging
+import time
+from typing import Optional, Dict, Any, Tuple, List, Callable, Awaitable, AsyncIterator
+from contextlib import asynccontextmanager
+from uuid import uuid4
 import httpx
+import orjson
 from fasthtml.common import *
 from dataclasses import dataclass
-from datetime import datetime
+
+# Load environment variables from .env file if it exists. This runs at import so that
+# uvicorn worker processes, which import this module by name, see the same settings.
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+# Accept any casing of the level name and fall back to INFO for unknown values
+log_level = logging.getLevelName(os.getenv("LOG_LEVEL", "INFO").strip().upper())
+logging.basicConfig(level=log_level if isinstance(log_level, int) else logging.INFO)
+log = logging.getLogger(__name__)
+# httpx logs every request at INFO; keep it out of the hot path unless debugging
+if not log.isEnabledFor(logging.DEBUG):
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# Request/response payloads can hold tokens and are large, so they are only logged,
+# truncated, when AGENTFORCE_DEBUG=1 is set on top of DEBUG logging
+DEBUG_PAYLOADS = os.getenv("AGENTFORCE_DEBUG") == "1" and log.isEnabledFor(logging.DEBUG)
+DEBUG_PAYLOAD_LIMIT = 256
+
+# Agent sessions idle longer than this are recreated rather than reused
+SESSION_IDLE_TIMEOUT = 30 * 60
+
+# Upper bound on tracked in-flight messages used for de-duplication
+MAX_INFLIGHT = 1024
+
+# Reply streams not opened within this many seconds are discarded, and at most this many wait at once
+PENDING_STREAM_TTL = 60
+MAX_PENDING_STREAMS = 1024
+
+# Idle pooled connections to Salesforce are kept this long (seconds), so a user pausing
+# between messages does not pay for a new TLS handshake
+def _env_seconds(name: str, default: float) -> float:
+    """Read a non-negative number of seconds from the environment, warning and using the default if invalid"""
+    raw = os.getenv(name, '').strip()
+    if not raw:
+        return default
+    try:
+        value = float(raw)
+    except ValueError:
+        value = -1.0
+    if not 0 <= value < float('inf'):
+        log.warning("Invalid %s=%r, using %s", name, raw, default)
+        return default
+    return value
+
+KEEPALIVE_EXPIRY = _env_seconds('AGENTFORCE_KEEPALIVE_EXPIRY', 90.0)
+
+# OAuth scopes the connected app must grant for the Agent API
+REQUIRED_SCOPES = frozenset({'sfap_api', 'chatbot_api', 'api'})
+
+# Message request body; only the sequence id, text and variables change per call
+MESSAGE_TEMPLATE = b'{"message":{"sequenceId":%d,"type":"Text","text":%s},"variables":%s}'
+
+# Pulls the session id straight out of the create-session body without parsing all of it
+SESSION_ID_PATTERN = re.compile(rb'"sessionId"\s*:\s*"([^"\\]+)"')
+
+class SessionInvalidError(Exception):
+    """Raised when Agentforce rejects a message because its session has expired or is unknown"""
+
+def _body_excerpt(body: bytes, limit: int = 512) -> str:
+    """Decode the start of a response body for error messages and logs"""
+    return body[:limit].decode('utf-8', 'replace')
 
 # Agentforce API configuration
 @dataclass
@@ -19,6 +89,78 @@ class AgentforceConfig:
     client_id: str
     client_secret: str
     agent_id: str
+    streaming: bool = True
+
+class _Batcher:
+    """
+    Coalesce messages sent to the same key within a short window into one call.
+    The agent answers a merged turn once, so only the last waiter gets the result;
+    the earlier ones resolve to None and render no reply of their own.
+    """
+
+    def __init__(self, send: Callable[[str, str], Awaitable[Any]], window: float = 0.02, max_batch: int = 8):
+        self._send = send
+        self._window = window
+        self._max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumer: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._dispatches: set = set()
+
+    async def submit(self, key: str, message: str) -> Any:
+        """Queue a message and wait for its batch; None if a later message in the batch carries the result"""
+        loop = asyncio.get_running_loop()
+        if self._consumer is None or self._consumer.done() or self._loop is not loop:
+            self._queue = asyncio.Queue()
+            self._consumer = loop.create_task(self._run())
+            self._loop = loop
+
+        future = loop.create_future()
+        self._queue.put_nowait((key, message, future))
+        return await future
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            if self._queue.qsize() < self._max_batch - 1:
+                await asyncio.sleep(self._window)
+            while len(batch) < self._max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            groups: Dict[str, List[Tuple[str, asyncio.Future]]] = {}
+            for key, message, future in batch:
+                groups.setdefault(key, []).append((message, future))
+
+            # Dispatch each key concurrently so a slow agent turn does not hold up the queue
+            for key, items in groups.items():
+                task = asyncio.create_task(self._dispatch(key, items))
+                self._dispatches.add(task)
+                task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, key: str, items: List[Tuple[str, asyncio.Future]]) -> None:
+        try:
+            result = await self._send(key, "\n\n".join(message for message, _ in items))
+        except Exception as e:
+            result, error = None, e
+        else:
+            error = None
+
+        # Hand the reply (or error) to the last waiter still listening; the rest get None
+        waiting = [future for _, future in items if not future.done()]
+        for future in waiting[:-1]:
+            future.set_result(None)
+        if waiting:
+            if error is not None:
+                waiting[-1].set_exception(error)
+            else:
+                waiting[-1].set_result(result)
+
+    def close(self) -> None:
+        """Stop the consumer task"""
+        if self._consumer is not None:
+            self._consumer.cancel()
+        self._consumer = None
+        self._queue = None
 
 class AgentforceClient:
     """Python client for Salesforce Agentforce API"""
@@ -27,6 +169,48 @@ class AgentforceClient:
         self.config = config
         self.access_token: Optional[str] = None
         self.api_instance_url: Optional[str] = None
+        self._token_expiry: float = 0.0
+        # Single-flight guards so concurrent requests share one authentication / session creation
+        self._auth_lock = asyncio.Lock()
+        # Session creations in progress: user key -> pending session id, shared by that user's requests
+        self._session_creates: Dict[str, asyncio.Future] = {}
+        # Request headers for the current token, rebuilt only when the token changes
+        self._auth_headers: Dict[str, str] = {}
+        self._stream_headers: Dict[str, str] = {}
+        # Per-user agent sessions: user key -> (session id, expiry)
+        self._sessions: Dict[str, Tuple[str, float]] = {}
+        # Session opened ahead of time for the next new user: (session id, expiry)
+        self._spare_session: Optional[Tuple[str, float]] = None
+        self._batcher = _Batcher(self._send_turn)
+        # In-flight messages: (user key, text) -> pending result, shared by identical sends
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Return the shared HTTP client, creating it for the running event loop if needed"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            # A pooled client is tied to the loop it was created on, so rebuild it on a new loop
+            self._client = httpx.AsyncClient(
+                http2=True,
+                timeout=30.0,
+                limits=httpx.Limits(
+                    max_connections=100,
+                    max_keepalive_connections=50,
+                    keepalive_expiry=KEEPALIVE_EXPIRY
+                )
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self) -> None:
+        """Close the shared HTTP client and release pooled connections"""
+        self._batcher.close()
+        if self._client is not None and self._client_loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+        self._client_loop = None
 
     async def authenticate(self) -> None:
         """Authenticate with Salesforce using OAuth2 client credentials"""
@@ -38,45 +222,85 @@ class AgentforceClient:
             'client_secret': self.config.client_secret
         }
 
-        print(f"DEBUG: Authenticating with URL: {auth_url}")
-        print(f"DEBUG: Client ID: {self.config.client_id[:10]}...")
+        log.debug("Authenticating with URL: %s", auth_url)
+        log.debug("Client ID: %s...", self.config.client_id[:10])
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                auth_url,
-                data=data,
-                headers={'Content-Type': 'application/x-www-form-urlencoded'}
-            )
+        client = await self._get_client()
+        response = await client.post(
+            auth_url,
+            data=data,
+            headers={'Content-Type': 'application/x-www-form-urlencoded'}
+        )
 
-            print(f"DEBUG: Auth response status: {response.status_code}")
-            print(f"DEBUG: Auth response body: {response.text}")
+        body = await response.aread()
 
-            if not response.is_success:
-                raise Exception(f"Authentication failed: {response.status_code} - {response.text}")
+        log.debug("Auth response status: %s", response.status_code)
+        if DEBUG_PAYLOADS:
+            log.debug("Auth response body: %s", _body_excerpt(body, DEBUG_PAYLOAD_LIMIT))
+
+        if not response.is_success:
+            raise Exception(f"Authentication failed: {response.status_code} - {_body_excerpt(body)}")
+
+        auth_data = orjson.loads(body)
+
+        # Check required scopes
+        scopes = auth_data.get('scope', '').split()
+
+        if not REQUIRED_SCOPES.issubset(scopes):
+            raise Exception(f"Missing required OAuth scopes. Required: {sorted(REQUIRED_SCOPES)}, Found: {scopes}")
+
+        self.access_token = auth_data['access_token']
+        self.api_instance_url = auth_data['api_instance_url']
+        # Refresh a minute early so a token never expires mid-request
+        self._token_expiry = time.monotonic() + int(auth_data.get('expires_in', 1800)) - 60
+        self._auth_headers = {
+            'Authorization': f'Bearer {self.access_token}',
+            'Content-Type': 'application/json',
+            'Accept': 'application/json'
+        }
+        self._stream_headers = {**self._auth_headers, 'Accept': 'text/event-stream'}
+
+        log.debug("Authentication successful. API URL: %s", self.api_instance_url)
+
+    def _token_valid(self) -> bool:
+        """Check whether the cached access token can still be used"""
+        return self.access_token is not None and time.monotonic() < self._token_expiry
 
-            auth_data = response.json()
+    async def _ensure_token(self) -> None:
+        """Authenticate if there is no access token or the cached one has expired"""
+        if self._token_valid():
+            return
+        async with self._auth_lock:
+            # Another request may have refreshed the token while we waited for the lock
+            if not self._token_valid():
+                await self.authenticate()
 
-            # Check required scopes
-            scopes = set(auth_data.get('scope', '').split(' '))
-            required_scopes = {'sfap_api', 'chatbot_api', 'api'}
+    def _invalidate_token(self, rejected: Dict[str, str]) -> None:
+        """Drop the token a request was rejected with, unless it has already been replaced"""
+        if rejected is self._auth_headers or rejected is self._stream_headers:
+            self.access_token = None
 
-            if not required_scopes.issubset(scopes):
-                raise Exception(f"Missing required OAuth scopes. Required: {required_scopes}, Found: {scopes}")
+    async def _authorized_post(self, url: str, **kwargs) -> httpx.Response:
+        """POST JSON with the bearer token, re-authenticating and retrying once on HTTP 401"""
+        client = await self._get_client()
+        headers = self._auth_headers
+        response = await client.post(url, headers=headers, **kwargs)
 
-            self.access_token = auth_data['access_token']
-            self.api_instance_url = auth_data['api_instance_url']
+        if response.status_code == 401:
+            self._invalidate_token(headers)
+            await self._ensure_token()
+            response = await client.post(url, headers=self._auth_headers, **kwargs)
 
-            print(f"DEBUG: Authentication successful. API URL: {self.api_instance_url}")
+        return response
 
     async def create_session(self) -> str:
         """Create a new agent session"""
-        if not self.access_token or not self.api_instance_url:
-            raise Exception("Client not authenticated")
+        await self._ensure_token()
 
         session_url = f"{self.api_instance_url}/einstein/ai-agent/v1/agents/{self.config.agent_id}/sessions"
 
         session_data = {
-            "externalSessionKey": f"fasthtml-{datetime.now().timestamp()}",
+            "externalSessionKey": f"fasthtml-{time.time_ns()}",
             "instanceConfig": {
                 "endpoint": self.config.instance_url
             },
@@ -87,68 +311,228 @@ class AgentforceClient:
             "bypassUser": True
         }
 
-        headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json'
-        }
+        log.debug("Creating session with URL: %s", session_url)
+        if DEBUG_PAYLOADS:
+            log.debug("Session data: %s", session_data)
 
-        print(f"DEBUG: Creating session with URL: {session_url}")
-        print(f"DEBUG: Session data: {json.dumps(session_data, indent=2)}")
-        print(f"DEBUG: Headers: {headers}")
-
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                session_url,
-                json=session_data,
-                headers=headers
-            )
+        response = await self._authorized_post(
+            session_url,
+            content=orjson.dumps(session_data)
+        )
 
-            print(f"DEBUG: Response status: {response.status_code}")
-            print(f"DEBUG: Response headers: {dict(response.headers)}")
-            print(f"DEBUG: Response body: {response.text}")
+        body = await response.aread()
 
-            if not response.is_success:
-                raise Exception(f"Session creation failed: {response.status_code} - {response.text}")
+        log.debug("Response status: %s", response.status_code)
+        if DEBUG_PAYLOADS:
+            log.debug("Response headers: %s", response.headers)
+            log.debug("Response body: %s", _body_excerpt(body, DEBUG_PAYLOAD_LIMIT))
 
-            session_info = response.json()
-            return session_info['sessionId']
+        if not response.is_success:
+            raise Exception(f"Session creation failed: {response.status_code} - {_body_excerpt(body)}")
 
-    async def send_sync_message(self, session_id: str, message: str, variables: list = None) -> Dict[str, Any]:
-        """Send a synchronous message to the agent"""
-        if not self.access_token or not self.api_instance_url:
-            raise Exception("Client not authenticated")
+        match = SESSION_ID_PATTERN.search(body)
+        if match:
+            return match.group(1).decode()
 
-        if variables is None:
-            variables = []
+        # Unusual formatting (e.g. escaped characters): fall back to a full parse
+        session_info = orjson.loads(body)
+        return session_info['sessionId']
 
-        message_url = f"{self.api_instance_url}/einstein/ai-agent/v1/sessions/{session_id}/messages"
+    @staticmethod
+    def _message_payload(message: str, variables: list = None) -> bytes:
+        """Encode the request body for a text message"""
+        return MESSAGE_TEMPLATE % (
+            time.time_ns() // 1_000_000,
+            orjson.dumps(message),
+            orjson.dumps(variables) if variables else b'[]'
+        )
 
-        message_data = {
-            "message": {
-                "sequenceId": int(datetime.now().timestamp() * 1000),
-                "type": "Text",
-                "text": message
-            },
-            "variables": variables
-        }
+    async def _post_message(self, session_id: str, message: str, variables: list = None) -> httpx.Response:
+        """POST a message to an agent session and return the raw response"""
+        await self._ensure_token()
 
-        headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json',
-            'Accept': 'application/json'
-        }
+        message_url = f"{self.api_instance_url}/einstein/ai-agent/v1/sessions/{session_id}/messages"
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                message_url,
-                json=message_data,
-                headers=headers
-            )
+        return await self._authorized_post(
+            message_url,
+            content=self._message_payload(message, variables)
+        )
 
+    @asynccontextmanager
+    async def _open_stream(self, session_id: str, message: str, variables: list = None) -> AsyncIterator[httpx.Response]:
+        """Open a streaming message request, re-authenticating and retrying once on HTTP 401"""
+        await self._ensure_token()
+
+        stream_url = f"{self.api_instance_url}/einstein/ai-agent/v1/sessions/{session_id}/messages/stream"
+        content = self._message_payload(message, variables)
+        client = await self._get_client()
+
+        for attempt in range(2):
+            headers = self._stream_headers
+            async with client.stream("POST", stream_url, content=content, headers=headers) as response:
+                if response.status_code == 401 and attempt == 0:
+                    self._invalidate_token(headers)
+                    await self._ensure_token()
+                    continue
+                yield response
+                return
+
+    @staticmethod
+    async def _iter_text_chunks(response: httpx.Response) -> AsyncIterator[str]:
+        """Yield agent text from an Agentforce server-sent event stream"""
+        streamed = False
+        async for line in response.aiter_lines():
+            if not line.startswith('data:'):
+                continue
+            try:
+                event = orjson.loads(line[5:])
+            except orjson.JSONDecodeError:
+                continue
+
+            msg = event.get('message') or {}
+            if msg.get('type') == 'TextChunk':
+                streamed = True
+                yield msg.get('message', '')
+            elif msg.get('type') == 'Inform' and not streamed:
+                # Inform repeats the whole reply; only use it when no chunks arrived
+                yield msg.get('message', '')
+
+    async def send_streaming_message(self, session_id: str, message: str, variables: list = None) -> AsyncIterator[str]:
+        """
+        Send a message to the agent and yield the reply text as it streams in.
+        Raises SessionInvalidError, before any text is yielded, if the session is gone.
+        """
+        async with self._open_stream(session_id, message, variables) as response:
             if not response.is_success:
-                raise Exception(f"Message send failed: {response.status_code} - {response.text}")
+                body = await response.aread()
+                error = SessionInvalidError if self._is_session_invalid(response) else Exception
+                raise error(f"Message stream failed: {response.status_code} - {_body_excerpt(body)}")
 
-            return response.json()
+            async for chunk in self._iter_text_chunks(response):
+                yield chunk
+
+    async def send_sync_message(self, session_id: str, message: str, variables: list = None) -> Dict[str, Any]:
+        """Send a synchronous message to the agent"""
+        response = await self._post_message(session_id, message, variables)
+
+        body = await response.aread()
+        if not response.is_success:
+            raise Exception(f"Message send failed: {response.status_code} - {_body_excerpt(body)}")
+
+        return orjson.loads(body)
+
+    async def get_session(self, user_key: str) -> str:
+        """Return the agent session for a user, creating one if missing or idle too long"""
+        cached = self._sessions.get(user_key)
+        if cached is not None and time.monotonic() < cached[1]:
+            return cached[0]
+
+        # Only this user's concurrent requests wait on the same creation; other users proceed in parallel
+        pending = self._session_creates.get(user_key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._open_user_session(user_key))
+            self._session_creates[user_key] = pending
+            pending.add_done_callback(lambda _: self._session_creates.pop(user_key, None))
+
+        # Shield so one caller disconnecting does not cancel the creation for the others
+        return await asyncio.shield(pending)
+
+    async def _open_user_session(self, user_key: str) -> str:
+        """Give a user the spare session if it is still fresh, otherwise create a new one"""
+        # No await between the read and the reset, so two users can never take the same spare
+        spare, self._spare_session = self._spare_session, None
+
+        if spare is not None and time.monotonic() < spare[1]:
+            session_id = spare[0]
+        else:
+            session_id = await self.create_session()
+        self._evict_expired_sessions()
+        self._sessions[user_key] = (session_id, time.monotonic() + SESSION_IDLE_TIMEOUT)
+        return session_id
+
+    def _evict_expired_sessions(self) -> None:
+        """Forget sessions that have been idle past their expiry so the map does not grow forever"""
+        now = time.monotonic()
+        expired = [key for key, (_, expiry) in self._sessions.items() if now >= expiry]
+        for key in expired:
+            del self._sessions[key]
+
+    def _drop_session(self, user_key: str, session_id: str) -> None:
+        """Forget a user's session, unless it has already been replaced"""
+        cached = self._sessions.get(user_key)
+        if cached is not None and cached[0] == session_id:
+            del self._sessions[user_key]
+
+    async def warm_up(self) -> None:
+        """Authenticate and open a spare session so the first chat skips both round trips"""
+        await self._ensure_token()
+        if self._spare_session is None:
+            session_id = await self.create_session()
+            self._spare_session = (session_id, time.monotonic() + SESSION_IDLE_TIMEOUT)
+
+    @staticmethod
+    def _is_session_invalid(response: httpx.Response) -> bool:
+        """Check whether a failed message response means the agent session is gone"""
+        return response.status_code in (401, 404) and (b'Session' in response.content or b'Invalid' in response.content)
+
+    async def send_message(self, user_key: str, message: str, variables: list = None) -> Optional[Dict[str, Any]]:
+        """
+        Send a message on the user's session, batching messages that arrive together.
+        Returns None when the message was merged into a turn whose reply goes to another
+        caller, including an identical message that was already on its way.
+        """
+        if variables:
+            return await self._send_turn(user_key, message, variables)
+
+        # Identical messages already on their way for this user share that request;
+        # the original caller renders the reply, so duplicates only wait for it
+        key = (user_key, message)
+        pending = self._inflight.get(key)
+        if pending is not None:
+            # Wait on the original send; it reports any failure under its own message
+            await asyncio.wait({pending})
+            return None
+
+        pending = asyncio.ensure_future(self._batcher.submit(user_key, message))
+        if len(self._inflight) < MAX_INFLIGHT:
+            self._inflight[key] = pending
+            pending.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        # Shield so one caller disconnecting does not cancel the send for the others
+        return await asyncio.shield(pending)
+
+    async def stream_message(self, user_key: str, message: str) -> AsyncIterator[str]:
+        """Stream a reply on the user's session, recreating the session once if it expired"""
+        for attempt in range(2):
+            session_id = await self.get_session(user_key)
+            try:
+                async for chunk in self.send_streaming_message(session_id, message):
+                    yield chunk
+            except SessionInvalidError:
+                if attempt == 1:
+                    raise
+                self._drop_session(user_key, session_id)
+                continue
+
+            self._sessions[user_key] = (session_id, time.monotonic() + SESSION_IDLE_TIMEOUT)
+            return
+
+    async def _send_turn(self, user_key: str, message: str, variables: list = None) -> Dict[str, Any]:
+        """Send one turn on the user's session, recreating the session once if it expired"""
+        session_id = await self.get_session(user_key)
+        response = await self._post_message(session_id, message, variables)
+
+        if self._is_session_invalid(response):
+            self._drop_session(user_key, session_id)
+            session_id = await self.get_session(user_key)
+            response = await self._post_message(session_id, message, variables)
+
+        body = await response.aread()
+        if not response.is_success:
+            raise Exception(f"Message send failed: {response.status_code} - {_body_excerpt(body)}")
+
+        self._sessions[user_key] = (session_id, time.monotonic() + SESSION_IDLE_TIMEOUT)
+        return orjson.loads(body)
 
 def build_dynamic_ui(response: Dict[str, Any]) -> Any:
     """
@@ -157,6 +541,17 @@ def build_dynamic_ui(response: Dict[str, Any]) -> Any:
     """
     if not isinstance(response, dict):
         return P(str(response))
+
+    # Fast path: the usual reply carries its text in the first message
+    messages = response.get('messages')
+    if type(messages) is list and messages:
+        first = messages[0]
+        if type(first) is dict:
+            message_text = first.get('message')
+            if type(message_text) is str:
+                message_text = message_text.strip()
+                if message_text:
+                    return P(message_text)
     
     # Extract message text from response
     if 'messages' in response and isinstance(response['messages'], list):
@@ -167,7 +562,7 @@ def build_dynamic_ui(response: Dict[str, Any]) -> Any:
                     return P(message_text)
     
     # Fallback: show formatted response
-    return P(json.dumps(response, indent=2), style="font-size: 0.9em;")
+    return P(orjson.dumps(response, option=orjson.OPT_INDENT_2).decode(), style="font-size: 0.9em;")
 
 # FastHTML Application with custom styling
 custom_css = Style("""
@@ -189,15 +584,85 @@ custom_css = Style("""
     .agent-bubble { background-color: #d1e7dd; color: #0f5132; padding: 12px 16px; margin: 8px 20% 8px 0; border-radius: 18px 18px 18px 4px; }
     .error-bubble { background-color: #f8d7da; color: #842029; padding: 12px 16px; margin: 8px 20% 8px 0; border-radius: 18px 18px 18px 4px; }
     .bubble p { margin: 0; }
+    .stream-error { color: #842029; }
     .config-info { margin: 20px 0; padding: 0 20px; }
     .config-info p { margin: 10px 0; }
 """)
 
-app, rt = fast_app(hdrs=(custom_css,))
+async def _retry_warm_up(client: AgentforceClient) -> None:
+    """Keep retrying the startup warm-up in the background with exponential backoff"""
+    delay = 1.0
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            await client.warm_up()
+            log.info("Agentforce warm-up succeeded after retry")
+            return
+        except Exception as e:
+            delay = min(delay * 2, 60.0)
+            log.warning("Agentforce warm-up failed, retrying in %.0fs: %s", delay, e)
+
+async def warm_up_agentforce_client():
+    """Authenticate and open an agent session at startup, before any user request"""
+    global agentforce_client, warm_up_task
+
+    config = load_config()
+    if not is_config_valid(config):
+        return
+
+    if agentforce_client is None:
+        agentforce_client = AgentforceClient(config)
+
+    try:
+        await agentforce_client.warm_up()
+    except Exception as e:
+        log.warning("Agentforce warm-up failed, retrying in the background: %s", e)
+        warm_up_task = asyncio.create_task(_retry_warm_up(agentforce_client))
+
+async def close_agentforce_client():
+    """Close pooled Salesforce connections when the server shuts down"""
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    if agentforce_client is not None:
+        await agentforce_client.aclose()
+
+# htmx server-sent events extension, used to stream agent replies into the chat
+sse_ext = Script(src="https://unpkg.com/htmx-ext-sse@2.2.1/sse.js")
+
+app, rt = fast_app(
+    hdrs=(custom_css, sse_ext),
+    on_startup=[warm_up_agentforce_client],
+    on_shutdown=[close_agentforce_client]
+)
 
 # Global client instance
 agentforce_client: Optional[AgentforceClient] = None
-current_session_id: Optional[str] = None
+warm_up_task: Optional[asyncio.Task] = None
+
+# Messages waiting for their reply stream to be opened: stream id -> (user key, message, created at)
+pending_streams: Dict[str, Tuple[str, str, float]] = {}
+
+# Replies pending or streaming right now: (user key, message) -> stream id, used to skip duplicates
+active_streams: Dict[Tuple[str, str], str] = {}
+
+def release_stream(user_key: str, message: str, stream_id: str) -> None:
+    """Stop treating a message as in flight once its reply stream is finished or abandoned"""
+    if active_streams.get((user_key, message)) == stream_id:
+        del active_streams[(user_key, message)]
+
+def prune_pending_streams() -> None:
+    """Drop reply streams the browser never opened, so abandoned messages do not pile up"""
+    cutoff = time.monotonic() - PENDING_STREAM_TTL
+    stale = [stream_id for stream_id, (_, _, created) in pending_streams.items() if created < cutoff]
+    for stream_id in stale:
+        user_key, message, _ = pending_streams.pop(stream_id)
+        release_stream(user_key, message, stream_id)
+
+    # Entries are in insertion order, so the oldest go first when the cap is reached
+    while len(pending_streams) >= MAX_PENDING_STREAMS:
+        stream_id = next(iter(pending_streams))
+        user_key, message, _ = pending_streams.pop(stream_id)
+        release_stream(user_key, message, stream_id)
 
 def load_config() -> AgentforceConfig:
     """Load configuration from environment variables"""
@@ -205,82 +670,90 @@ def load_config() -> AgentforceConfig:
         instance_url=os.getenv('SALESFORCE_INSTANCE_URL', ''),
         client_id=os.getenv('SALESFORCE_CLIENT_ID', ''),
         client_secret=os.getenv('SALESFORCE_CLIENT_SECRET', ''),
-        agent_id=os.getenv('SALESFORCE_AGENT_ID', '')
+        agent_id=os.getenv('SALESFORCE_AGENT_ID', ''),
+        streaming=os.getenv('AGENTFORCE_STREAMING', '1') == '1'
     )
 
-@rt('/')
-def home():
-    """Home page with configuration and chat interface"""
-    global agentforce_client
-
-    config = load_config()
-    config_valid = all([
+def is_config_valid(config: AgentforceConfig) -> bool:
+    """Check that all required Salesforce settings are present"""
+    return all([
         config.instance_url,
         config.client_id,
         config.client_secret,
         config.agent_id
     ])
 
-    if not config_valid:
-        return Titled("Agentforce API Client - Configuration Required",
+# Static pages are built once at import; their markup never changes between requests
+_CONFIG_ERROR_PAGE = Titled("Agentforce API Client - Configuration Required",
+    Div(
+        Div(
+            P("Configuration Required", style="font-size: 1.5em; font-weight: bold;"),
+            P("Please set the following environment variables:"),
             Div(
-                Div(
-                    P("Configuration Required", style="font-size: 1.5em; font-weight: bold;"),
-                    P("Please set the following environment variables:"),
-                    Div(
-                        P("• SALESFORCE_INSTANCE_URL - Your Salesforce org domain"),
-                        P("• SALESFORCE_CLIENT_ID - Connected app client ID"),
-                        P("• SALESFORCE_CLIENT_SECRET - Connected app client secret"),
-                        P("• SALESFORCE_AGENT_ID - Agent ID"),
-                        cls="config-info"
-                    ),
-                    P("Create a .env file in the project root with these values."),
-                    cls="alert alert-warning"
-                ),
-                cls="container"
-            )
-        )
+                P("• SALESFORCE_INSTANCE_URL - Your Salesforce org domain"),
+                P("• SALESFORCE_CLIENT_ID - Connected app client ID"),
+                P("• SALESFORCE_CLIENT_SECRET - Connected app client secret"),
+                P("• SALESFORCE_AGENT_ID - Agent ID"),
+                cls="config-info"
+            ),
+            P("Create a .env file in the project root with these values."),
+            cls="alert alert-warning"
+        ),
+        cls="container"
+    )
+)
+
+_CHAT_PAGE = Titled("Agentforce AI Agent Chat",
+    Div(
+        # Chat messages container - messages appear here
+        Div(
+            id="chat-container",
+            cls="chat-container"
+        ),
+
+        # Input form at the bottom
+        Form(
+            Textarea(
+                id="message",
+                name="message",
+                cls="textarea",
+                placeholder="Type your message and press Send...",
+                required=True
+            ),
+            Button("Send Message", type="submit", cls="btn btn-primary"),
+            id="chat-form",
+            method="post",
+            action="/chat",
+            hx_post="/chat",
+            hx_target="#chat-container",
+            hx_swap="beforeend swap:1s",
+            hx_on__after_request="document.querySelector('#message').value = ''",
+            cls="input-group"
+        ),
+
+        cls="container"
+    )
+)
+
+@rt('/')
+def home():
+    """Home page with configuration and chat interface"""
+    global agentforce_client
+
+    config = load_config()
+
+    if not is_config_valid(config):
+        return _CONFIG_ERROR_PAGE
 
     # Initialize client if not already done
     if agentforce_client is None:
         agentforce_client = AgentforceClient(config)
 
-    return Titled("Agentforce AI Agent Chat",
-        Div(
-            # Chat messages container - messages appear here
-            Div(
-                id="chat-container",
-                cls="chat-container"
-            ),
-            
-            # Input form at the bottom
-            Form(
-                Textarea(
-                    id="message",
-                    name="message",
-                    cls="textarea",
-                    placeholder="Type your message and press Send...",
-                    required=True
-                ),
-                Button("Send Message", type="submit", cls="btn btn-primary"),
-                id="chat-form",
-                method="post",
-                action="/chat",
-                hx_post="/chat",
-                hx_target="#chat-container",
-                hx_swap="beforeend swap:1s",
-                hx_on__after_request="document.querySelector('#message').value = ''",
-                cls="input-group"
-            ),
-            
-            cls="container"
-        )
-    )
+    return _CHAT_PAGE
 
 @rt('/chat', methods=['POST'])
-async def chat(message: str):
+async def chat(message: str, session):
     """Handle chat message - uses dynamic UI generation"""
-    global agentforce_client, current_session_id
 
     if not agentforce_client:
         return Div(
@@ -289,16 +762,8 @@ async def chat(message: str):
         )
 
     try:
-        # Authenticate if not already done
-        if not agentforce_client.access_token:
-            await agentforce_client.authenticate()
-
-        # Create session if not exists
-        if not current_session_id:
-            current_session_id = await agentforce_client.create_session()
-
-        # Send message
-        response = await agentforce_client.send_sync_message(current_session_id, message)
+        # Each browser gets its own agent session, keyed by a cookie-backed id
+        user_key = session.setdefault('chat_id', uuid4().hex)
 
         # Create user message bubble
         user_bubble = Div(
@@ -306,6 +771,33 @@ async def chat(message: str):
             cls="user-bubble bubble"
         )
 
+        if agentforce_client.config.streaming:
+            # The agent bubble opens an SSE connection and appends the reply as it streams
+            prune_pending_streams()
+
+            # An identical message is already being answered; its reply shows under the first bubble
+            if (user_key, message) in active_streams:
+                return user_bubble
+
+            stream_id = uuid4().hex
+            pending_streams[stream_id] = (user_key, message, time.monotonic())
+            active_streams[(user_key, message)] = stream_id
+            agent_bubble = Div(
+                P(sse_swap="message", hx_swap="beforeend"),
+                hx_ext="sse",
+                sse_connect=f"/chat/stream/{stream_id}",
+                sse_close="close",
+                cls="agent-bubble bubble"
+            )
+            return Div(user_bubble, agent_bubble)
+
+        # Send message (creates or refreshes the agent session as needed)
+        response = await agentforce_client.send_message(user_key, message)
+
+        # Merged into a later message's turn; the reply is shown under that message
+        if response is None:
+            return user_bubble
+
         # Generate DYNAMIC UI based on response structure
         dynamic_agent_ui = build_dynamic_ui(response)
         
@@ -327,13 +819,37 @@ async def chat(message: str):
         )
         return error_bubble
 
-if __name__ == '__main__':
-    # Load environment variables from .env file if it exists
-    try:
-        from dotenv import load_dotenv
-        load_dotenv()
-    except ImportError:
-        pass
+@rt('/chat/stream/{stream_id}')
+async def chat_stream(stream_id: str):
+    """Stream the agent reply for a pending chat message as server-sent events"""
+    pending = pending_streams.pop(stream_id, None)
+
+    async def events():
+        if pending is None or not agentforce_client:
+            yield sse_message(Span("This reply is no longer available.", cls="stream-error"))
+        else:
+            user_key, message, _ = pending
+            try:
+                async for chunk in agentforce_client.stream_message(user_key, message):
+                    yield sse_message(Span(chunk))
+            except Exception as e:
+                yield sse_message(Span(f"Error: {str(e)}", cls="stream-error"))
+            finally:
+                release_stream(user_key, message, stream_id)
+        yield sse_message(Span(), event="close")
+
+    return EventStream(events())
 
+if __name__ == '__main__':
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+
+    # "auto" picks uvloop and httptools when installed (uvicorn[standard]), else asyncio/h11.
+    # Sessions live in process memory, so keep one worker unless requests are sticky per user.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="auto",
+        http="auto",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1"))
+    )